@@ -1,26 +1,90 @@
 import os
 import json
-import imagehash
-import fitz  # PyMuPDF for extracting images
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer
+import orjson
+import numpy as np
+import scipy.fft
+import fitz  # PyMuPDF for extracting text and images
 from PIL import Image
 import io
-from collections import defaultdict
 import re
 from difflib import SequenceMatcher
+import multiprocessing
+from collections import Counter, defaultdict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 # Set paths
 PDF_DIRECTORY = "./test"  # Directory containing PDFs
 OUTPUT_DIRECTORY = "./processed_data"  # Where extracted text and images will be saved
 IMAGE_OUTPUT_DIRECTORY = os.path.join(OUTPUT_DIRECTORY, "images")
+NUM_WORKERS = min(os.cpu_count() or 1, 8)  # Parallel PDF workers
+DEBUG = False  # Set to True to print per-page text and firm-info extraction details
+IMAGE_WRITE_THREADS = 2  # Background threads per PDF for writing extracted image files
+MAX_IMAGE_REPEATS = 10  # Drop an image once it (or a near-duplicate) has been seen this many times
+IMAGE_HASH_MAX_DISTANCE = 4  # Hashes differing in at most this many bits count as the same image
+JSON_OPTIONS = orjson.OPT_INDENT_2
+PHASH_SIZE = 8  # 8x8 DCT bits -> 64-bit perceptual hash
+PHASH_THUMBNAIL_SIZE = PHASH_SIZE * 4  # Same 32x32 thumbnail as imagehash.phash
+PHASH_DECODE_SIZE = PHASH_SIZE * 16  # Smallest decode size requested before the 32x32 resize
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")  # Split after sentence-ending punctuation
+
+# Firm/contact field patterns for extract_firm_info (kept separate: their matches overlap)
+FIRM_NAME_RE = re.compile(r"firm name\s+([\w\s.,&-]+?)\s+address", re.IGNORECASE)
+ADDRESS_RE = re.compile(r"address\s+(.+?)(?=\s+(corporate official name|phone|email))", re.IGNORECASE)
+STATE_CODE_RE = re.compile(r"\b([a-z]{2})\b")
+CAGE_WEBSITE_RE = re.compile(r"cage\s+\S+\s+[\d\s,-]+[a-z\s]+?\d{5}(?:-\d{4})?\s+(\S+\.\S+)", re.IGNORECASE)
+DOMAIN_RE = re.compile(r"([a-z0-9.-]+\.[a-z]{2,})")
+URL_PREFIX_RE = re.compile(r"^(https?:\/\/|httpwww\.|www\.)")
+CONTACT_NAME_RE = re.compile(r"name\s+([\w\s.,-]+?)\s+phone", re.IGNORECASE)
+PHONE_RE = re.compile(r"phone\s+([\d\s-]+)\s+email", re.IGNORECASE)
+WHITESPACE_RE = re.compile(r"\s+")
 
 # Ensure output directories exist
 os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
 os.makedirs(IMAGE_OUTPUT_DIRECTORY, exist_ok=True)
 
-# Track image occurrences to filter duplicate images
-image_counts = defaultdict(int)
+class HammingBKTree:
+    """BK-tree of 64-bit image hashes keyed by Hamming distance, with a count per distinct hash."""
+
+    def __init__(self):
+        self.root = None  # Nodes are [hash, count, {distance: child_node}]
+
+    def add(self, value):
+        """Record one occurrence of a hash."""
+        if self.root is None:
+            self.root = [value, 1, {}]
+            return
+        node = self.root
+        while True:
+            distance = (node[0] ^ value).bit_count()
+            if distance == 0:
+                node[1] += 1
+                return
+            if distance not in node[2]:
+                node[2][distance] = [value, 1, {}]
+                return
+            node = node[2][distance]
+
+    def count_within(self, value, max_distance):
+        """Count recorded occurrences of hashes within max_distance bits of value."""
+        total = 0
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, count, children = stack.pop()
+            distance = (node_value ^ value).bit_count()
+            if distance <= max_distance:
+                total += count
+            # Triangle inequality: only subtrees in [distance - max, distance + max] can hold matches
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    stack.append(child)
+        return total
+
+# Track image occurrences to filter duplicate images (updated in the parent process only)
+image_hash_tree = HammingBKTree()
+
+# Template text loaded once by main() and handed to each worker by init_worker
+worker_template_text = frozenset()
 
 def get_ngrams(text, n=5):
     words = text.split()
@@ -30,263 +94,299 @@ def get_ngrams(text, n=5):
 
 def clean_text(text):
     """Normalize text by removing extra spaces but keeping punctuation and capitalization."""
-    text = text.strip()  # Remove leading/trailing spaces
-    text = re.sub(r'\s+', ' ', text)  # Replace multiple spaces with a single space
-    return text  # Keep original case and punctuation
+    return " ".join(text.split())  # Trim and collapse whitespace; case and punctuation are kept
 
 
 def extract_firm_info(json_data):
-    """Extracts firm and contact information from JSON instead of reprocessing the PDF."""
+    """Extracts firm and contact information from the extracted result instead of reprocessing the PDF."""
     firm_info = {}
 
     # Ensure required pages exist in JSON
     text_by_page = json_data.get("text_by_page", {})
     page_2_text = text_by_page.get("2", "").lower()
-    # Force string key and debug print
+    # Force string key
     page_7_text = text_by_page.get(str(7), "").strip().lower()
 
-    # Debugging: Show exactly what is being retrieved
-    print(f"\n🔍 DEBUG: Extracted Text from Page 7 (Full JSON Value): {repr(page_7_text)}\n")
+    # Debugging: Show exactly what is being retrieved, including special characters
+    if DEBUG:
+        print("\n🔍 DEBUG: Extracted Text from Page 7 (Raw):", repr(page_7_text))
 
-    # If text is empty, print available keys
+    # Text is already stripped, so empty here also covers whitespace-only pages
     if not page_7_text:
-        print(f"⚠️ Warning: Page 7 text is missing or empty. Available keys: {list(text_by_page.keys())}")
-
-    # Debug: Show actual content including special characters
-    print("\n🔍 DEBUG: Extracted Text from Page 7 (Raw):", repr(page_7_text))
-
-    # Check if text is non-empty after removing excessive spaces
-    if not re.sub(r'\s+', '', page_7_text):  # Remove all whitespace and check if anything remains
         print(f"⚠️ Warning: Page 7 text not found or is empty. Available keys: {list(text_by_page.keys())}")
-
-    print("\n🔍 DEBUG: Extracted Text from Page 7 (Raw):", repr(page_7_text))  # Show exact content
-
-    print("\n🔍 DEBUG: Extracted Text from Page 7:\n", page_7_text)
-
-    if not page_7_text:
-        print("⚠️ Warning: Page 7 text not found in JSON.")
         return None
 
     # Extract and format company name
-    firm_name_match = re.search(r"firm name\s+([\w\s.,&-]+?)\s+address", page_2_text, re.IGNORECASE)
+    firm_name_match = FIRM_NAME_RE.search(page_2_text)
     firm_name = firm_name_match.group(1).strip().title() if firm_name_match else "N/A"
     print(f"✅ Company: {firm_name}")
     firm_info["company"] = firm_name
 
     # Extract and format address
-    print("\n🔍 DEBUG: Searching for 'address' in Page 7...\n")
+    if DEBUG:
+        print("\n🔍 DEBUG: Searching for 'address' in Page 7...\n")
 
-    address_match = re.search(r"address\s+(.+?)(?=\s+(corporate official name|phone|email))", page_7_text, re.IGNORECASE)
+    address_match = ADDRESS_RE.search(page_7_text)
     if address_match:
         address = address_match.group(1).strip()
         address = address.title()  # Capitalize each word
-        address = re.sub(r"\b([a-z]{2})\b", lambda x: x.group(1).upper(), address)  # Capitalize state
+        address = STATE_CODE_RE.sub(lambda x: x.group(1).upper(), address)  # Capitalize state
         print(f"✅ Address: {address}")
     else:
-        print("❌ DEBUG: Address Extraction Failed.")
+        if DEBUG:
+            print("❌ DEBUG: Address Extraction Failed.")
         address = "N/A"
 
     firm_info["address"] = address
 
     # **Fixing Website Extraction**
-    print("\n🔍 DEBUG: Searching for 'website' in Page 2...\n")
+    if DEBUG:
+        print("\n🔍 DEBUG: Searching for 'website' in Page 2...\n")
 
     # Try to extract a website (anything that looks like a domain name)
-    website_match = re.search(r"cage\s+\S+\s+[\d\s,-]+[a-z\s]+?\d{5}(?:-\d{4})?\s+(\S+\.\S+)", page_2_text, re.IGNORECASE)
+    website_match = CAGE_WEBSITE_RE.search(page_2_text)
 
     if website_match:
         website = website_match.group(1).strip()
     else:
         # Fallback: Find a proper domain anywhere in Page 2
-        possible_websites = re.findall(r"([a-z0-9.-]+\.[a-z]{2,})", page_2_text)
-        website = possible_websites[0].strip() if possible_websites else "N/A"
+        domain_match = DOMAIN_RE.search(page_2_text)  # First match only; no need to collect them all
+        website = domain_match.group(1).strip() if domain_match else "N/A"
 
     # **CLEANING: Remove unwanted prefixes**
-    website = re.sub(r"^(https?:\/\/|httpwww\.|www\.)", "", website).strip()
+    website = URL_PREFIX_RE.sub("", website).strip()
 
     print(f"✅ Website: {website}")
     firm_info["website"] = website
 
     # Extract and format name (was corporate_official_name)
-    name_match = re.search(r"name\s+([\w\s.,-]+?)\s+phone", page_7_text, re.IGNORECASE)
+    name_match = CONTACT_NAME_RE.search(page_7_text)
     name = name_match.group(1).strip() if name_match else "N/A"
-    name = re.sub(r"\s+", " ", name)  # Remove extra spaces and line breaks
+    name = WHITESPACE_RE.sub(" ", name)  # Remove extra spaces and line breaks
     name = name.title()  # Capitalize name correctly
     print(f"✅ Name: {name}")
     firm_info["name"] = name
 
     # Extract and format phone number
-    phone_match = re.search(r"phone\s+([\d\s-]+)\s+email", page_7_text, re.IGNORECASE)
+    phone_match = PHONE_RE.search(page_7_text)
     phone = phone_match.group(1).strip() if phone_match else "N/A"
     print(f"✅ Phone: {phone}")
     firm_info["phone"] = phone
 
     return firm_info if firm_info else None
 
-def extract_text_from_pdf(pdf_path, template_text):
-    """Extract text from a PDF file, capturing the first 9 and last 10-11 pages for contact details."""
+@lru_cache(maxsize=1)
+def build_template_index(template_text):
+    """Index template 5-grams to the templates containing them; built once and reused across PDFs in a worker."""
+    normalized_templates = {clean_text(s) for s in template_text if s.strip()}
+    ngram_index = defaultdict(list)  # 5-gram -> ids of templates containing it
+    template_sizes = []  # Number of distinct 5-grams per template id
+    for templ in normalized_templates:
+        templ_ngrams = get_ngrams(templ, 5)
+        if templ_ngrams:
+            for ngram in templ_ngrams:
+                ngram_index[ngram].append(len(template_sizes))
+            template_sizes.append(len(templ_ngrams))
+    return dict(ngram_index), template_sizes
+
+def matches_template(sentence_ngrams, ngram_index, template_sizes):
+    """Check whether the sentence contains more than 70% of some template's 5-grams."""
+    shared = Counter()  # Template id -> 5-grams it shares with the sentence
+    for ngram in sentence_ngrams:
+        templ_ids = ngram_index.get(ngram)
+        if templ_ids:
+            shared.update(templ_ids)
+    return any(count / template_sizes[templ_id] > 0.7 for templ_id, count in shared.items())
+
+def extract_text_from_pdf(pdf_document, template_text):
+    """Extract text from an open PDF, capturing the first 9 and last 10-11 pages for contact details."""
     text_by_page = {}
     contact_text_pages = {}
 
-    pdf_document = fitz.open(pdf_path)  # Open the PDF
     total_pages = len(pdf_document)
 
     # Define pages to extract for contact info
-    contact_pages = list(range(9)) + list(range(max(0, total_pages - 11), total_pages))
+    contact_pages = frozenset(range(9)) | frozenset(range(max(0, total_pages - 11), total_pages))
 
-    normalized_templates = {clean_text(s) for s in template_text if s.strip()}
+    ngram_index, template_sizes = build_template_index(template_text)
 
-    for page_number, page_layout in enumerate(extract_pages(pdf_path), start=1):
-        text = "".join(
-            element.get_text() for element in page_layout if isinstance(element, LTTextContainer)
-        ).strip()
+    for page_number, page in enumerate(pdf_document, start=1):
+        text = page.get_text("text").strip()
         
         if text:
             cleaned_text = clean_text(text)  # Ensure clean_text is not altering capitalization
             
-            print(f"DEBUG: Page {page_number} - Before Cleaning: {repr(text[:100])}...")
-            print(f"DEBUG: Page {page_number} - After Cleaning: {repr(cleaned_text[:100])}...")
-            print(f".")
-            sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', cleaned_text) if s.strip()]
+            if DEBUG:
+                print(f"DEBUG: Page {page_number} - Before Cleaning: {repr(text[:100])}...")
+                print(f"DEBUG: Page {page_number} - After Cleaning: {repr(cleaned_text[:100])}...")
+                print(f".")
+            sentences = [s.strip() for s in SENTENCE_SPLIT_RE.split(cleaned_text) if s.strip()]
             filtered_sentences = []
 
             for sentence in sentences:
-                sentence_clean = clean_text(sentence)
-                sentence_ngrams = get_ngrams(sentence_clean, 5)
-                skip = False
-
-                for templ in normalized_templates:
-                    templ_ngrams = get_ngrams(templ, 5)
-                    if templ_ngrams and len(sentence_ngrams.intersection(templ_ngrams)) / len(templ_ngrams) > 0.7:
-                        skip = True
-                        break
+                # Split from already-cleaned page text, so sentences need no second clean_text pass
+                sentence_ngrams = get_ngrams(sentence, 5)
 
-                if not skip:
+                if not matches_template(sentence_ngrams, ngram_index, template_sizes):
                     filtered_sentences.append(sentence)
 
             if filtered_sentences:
-                text_by_page[page_number] = "\n".join(filtered_sentences)
+                page_text = "\n".join(filtered_sentences)
+                text_by_page[str(page_number)] = page_text  # String keys, as stored in the JSON
 
                 # Capture first 9 and last 10-11 pages for contact info
                 if page_number - 1 in contact_pages:
-                    contact_text_pages[page_number] = "\n".join(filtered_sentences)
+                    contact_text_pages[str(page_number)] = page_text
 
-    pdf_document.close()
     return text_by_page, contact_text_pages
 
-def get_image_position(bbox, page_width, page_height):
-    """Determine the location of an image on the page based on its bounding box."""
-    if not isinstance(bbox, (list, tuple)) or len(bbox) != 4:
-        return "Unknown (Invalid Bounding Box)"
-    
-    x0, y0, x1, y1 = bbox
-    img_center_x = (x0 + x1) / 2
-    img_center_y = (y0 + y1) / 2
-
-    # Define grid areas (split into thirds)
-    width_third = page_width / 3
-    height_third = page_height / 3
-
-    # Determine horizontal position
-    if img_center_x < width_third:
-        horizontal = "Left"
-    elif img_center_x < 2 * width_third:
-        horizontal = "Center"
-    else:
-        horizontal = "Right"
+# Position labels indexed by vertical_third * 3 + horizontal_third
+POSITION_LABELS = np.array([f"{vertical} {horizontal}"
+                            for vertical in ("Top", "Middle", "Bottom")
+                            for horizontal in ("Left", "Center", "Right")], dtype=object)
 
-    # Determine vertical position
-    if img_center_y < height_third:
-        vertical = "Top"
-    elif img_center_y < 2 * height_third:
-        vertical = "Middle"
-    else:
-        vertical = "Bottom"
+def get_image_positions(bboxes, page_width, page_height):
+    """Determine the location of each image on a page from its (x0, y0, x1, y1) bounding box."""
+    if not bboxes:
+        return []
 
-    return f"{vertical} {horizontal}"
+    boxes = np.asarray(bboxes, dtype=np.float64)
+    img_center_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    img_center_y = (boxes[:, 1] + boxes[:, 3]) / 2
 
-def extract_images_from_pdf(pdf_path, pdf_filename):
-    """Extract embedded images from a PDF file and return perceptual hashes with position info."""
-    image_data = []
-    pdf_document = fitz.open(pdf_path)  # Open PDF with PyMuPDF
-    
-    for page_number in range(len(pdf_document)):
-        page = pdf_document[page_number]
-        images = page.get_images(full=True)
-        page_width, page_height = page.rect.width, page.rect.height  # Get page dimensions
-
-        for img_index, img in enumerate(images):
-            xref = img[0]  # Get image reference number
-            base_image = pdf_document.extract_image(xref)
-            img_bytes = base_image["image"]
-            img_ext = base_image["ext"]
-
-            # Convert image to PIL format
-            image = Image.open(io.BytesIO(img_bytes))
-
-            # Skip small images (e.g., single-pixel elements, small icons)
-            if image.width < 20 or image.height < 20:
-                print(f"⚠️ Skipping tiny image on Page {page_number+1}: {image.width}x{image.height}")
-                continue
-
-            # Compute perceptual hash
-            img_hash = str(imagehash.phash(image))
-
-            # Limit duplicate images appearing too frequently
-            image_counts[img_hash] += 1
-            if image_counts[img_hash] > 10:  # Skip if the same image appears more than 3 times
-                print(f"⚠️ Skipping repeated image (Hash: {img_hash}) on Page {page_number+1}")
-                continue
-
-            # Save extracted image
-            img_filename = f"{pdf_filename}_page{page_number+1}_img{img_index+1}.{img_ext}"
-            img_path = os.path.join(IMAGE_OUTPUT_DIRECTORY, img_filename)
-            image.save(img_path)
-
-            # Extract image bounding box (position)
-            try:
-                img_rects = page.get_image_rects(xref)  # Get bounding box from PyMuPDF
-                if img_rects:
-                    bbox = img_rects[0]  # Take the first bounding box (if multiple exist)
-                    position = get_image_position((bbox.x0, bbox.y0, bbox.x1, bbox.y1), page_width, page_height)
-                else:
-                    position = "Unknown (No Bounding Box)"
-            except Exception as e:
-                print(f"⚠️ Warning: Unable to get bounding box for image {img_index+1} on Page {page_number+1} in {pdf_filename}: {e}")
-                position = "Unknown (Error)"
-
-            # Store image info
-            image_data.append({
-                "page": page_number + 1,
-                "image_file": img_filename,
-                "hash": img_hash,
-                "position": position  # Add position info
-            })
-    
-    pdf_document.close()
-    return image_data
+    # Define grid areas (split into thirds); digitize gives 0/1/2 for Left/Center/Right and Top/Middle/Bottom
+    width_third = page_width / 3
+    height_third = page_height / 3
+    horizontal = np.digitize(img_center_x, [width_third, 2 * width_third])
+    vertical = np.digitize(img_center_y, [height_third, 2 * height_third])
+
+    return POSITION_LABELS[vertical * 3 + horizontal].tolist()
+
+def phash_thumbnail(img_bytes):
+    """Decode an image to the grayscale thumbnail used for perceptual hashing."""
+    thumbnail = Image.open(io.BytesIO(img_bytes))
+    # JPEGs decode straight to a small grayscale image via DCT scaling; other formats are unaffected
+    thumbnail.draft("L", (PHASH_DECODE_SIZE, PHASH_DECODE_SIZE))
+    thumbnail = thumbnail.convert("L").resize((PHASH_THUMBNAIL_SIZE, PHASH_THUMBNAIL_SIZE), Image.LANCZOS)
+    return np.asarray(thumbnail, dtype=np.float64)
+
+def compute_phashes(thumbnails):
+    """Compute imagehash-compatible perceptual hashes (64-bit ints) for a batch of thumbnails."""
+    if not thumbnails:
+        return []
+
+    # One 2-D DCT over the whole (N, 32, 32) stack instead of one call per image
+    dct = scipy.fft.dctn(np.stack(thumbnails), type=2, axes=(1, 2), workers=-1)
+    low_freq = dct[:, :PHASH_SIZE, :PHASH_SIZE].reshape(len(thumbnails), -1)
+    bits = low_freq > np.median(low_freq, axis=1, keepdims=True)
+    return [int.from_bytes(row.tobytes(), "big") for row in np.packbits(bits, axis=1)]
+
+def write_image_file(img_path, img_bytes):
+    """Write encoded image bytes to disk."""
+    with open(img_path, "wb") as f:
+        f.write(img_bytes)
+
+def extract_images_from_pdf(pdf_document, pdf_filename):
+    """Extract embedded images from an open PDF and return perceptual hashes with position info.
+
+    The result is column-oriented: parallel "page", "image_file", "hash" and "position" lists.
+    """
+    pages, image_files, positions = [], [], []
+    thumbnails = []
+    extracted_xrefs = {}  # xref -> (bytes, ext, thumbnail) for images reused across pages
+    pending_writes = []
+    # File writes release the GIL, so they overlap with PyMuPDF extraction and hashing on this thread
+    with ThreadPoolExecutor(max_workers=IMAGE_WRITE_THREADS) as writer:
+        for page_number in range(len(pdf_document)):
+            page = pdf_document[page_number]
+            images = page.get_images(full=True)
+            page_width, page_height = page.rect.width, page.rect.height  # Get page dimensions
+            page_bboxes = []  # Bounding boxes found on this page
+            positioned = []   # Index of the image each bounding box belongs to
+
+            for img_index, img in enumerate(images):
+                xref = img[0]  # Get image reference number
+
+                # Skip small images (e.g., single-pixel elements, small icons) using the width/height
+                # from the image dictionary, before the stream is extracted or decoded
+                img_width, img_height = img[2], img[3]
+                if img_width < 20 or img_height < 20:
+                    print(f"⚠️ Skipping tiny image on Page {page_number+1}: {img_width}x{img_height}")
+                    continue
+
+                # Extract and decode each image stream once, even if it is placed on many pages
+                if xref not in extracted_xrefs:
+                    base_image = pdf_document.extract_image(xref)
+                    img_bytes = base_image["image"]
+                    extracted_xrefs[xref] = (img_bytes, base_image["ext"], phash_thumbnail(img_bytes))
+                img_bytes, img_ext, thumbnail = extracted_xrefs[xref]
+
+                # Queue thumbnail for batched perceptual hashing
+                thumbnails.append(thumbnail)
+
+                # Save extracted image as the original encoded bytes (no decode/re-encode)
+                img_filename = f"{pdf_filename}_page{page_number+1}_img{img_index+1}.{img_ext}"
+                img_path = os.path.join(IMAGE_OUTPUT_DIRECTORY, img_filename)
+                pending_writes.append(writer.submit(write_image_file, img_path, img_bytes))
+
+                # Extract image bounding box (position)
+                try:
+                    img_rects = page.get_image_rects(xref)  # Get bounding box from PyMuPDF
+                    if img_rects:
+                        bbox = img_rects[0]  # Take the first bounding box (if multiple exist)
+                        page_bboxes.append((bbox.x0, bbox.y0, bbox.x1, bbox.y1))
+                        positioned.append(len(positions))
+                        position = None  # Filled in once the whole page has been collected
+                    else:
+                        position = "Unknown (No Bounding Box)"
+                except Exception as e:
+                    print(f"⚠️ Warning: Unable to get bounding box for image {img_index+1} on Page {page_number+1} in {pdf_filename}: {e}")
+                    position = "Unknown (Error)"
+
+                # Store image info
+                pages.append(page_number + 1)
+                image_files.append(img_filename)
+                positions.append(position)
+
+            # Classify every bounding box on the page at once
+            for idx, position in zip(positioned, get_image_positions(page_bboxes, page_width, page_height)):
+                positions[idx] = position
+
+        # Wait for the image files, re-raising any write error
+        for future in pending_writes:
+            future.result()
+
+    return {
+        "page": pages,
+        "image_file": image_files,
+        "hash": compute_phashes(thumbnails),  # Perceptual hashes for every image in the PDF at once
+        "position": positions
+    }
 
 def load_template_text():
     """Load template text from the JSON file."""
     template_text_file = "./processed_data/template_text.json"
     if os.path.exists(template_text_file):
         with open(template_text_file, "r", encoding="utf-8") as f:
-            return set(json.load(f).get("template_text", []))
-    return set()
+            return frozenset(json.load(f).get("template_text", []))
+    return frozenset()
+
+def init_worker(template_text):
+    """Pool initializer: keep the template text loaded in the parent for every PDF this worker handles."""
+    global worker_template_text
+    worker_template_text = template_text
 
 def process_pdf(pdf_file):
     """Process a single PDF file to extract firm information, images, and structured contact details."""
-    template_text = load_template_text()
+    template_text = worker_template_text
     
     pdf_path = os.path.join(PDF_DIRECTORY, pdf_file)
     pdf_filename = os.path.splitext(pdf_file)[0]
-    json_path = os.path.join(OUTPUT_DIRECTORY, pdf_filename + ".json")
 
-    # Extract text from PDF
-    extracted_text, _ = extract_text_from_pdf(pdf_path, template_text)
-    
-    # Extract images
-    extracted_images = extract_images_from_pdf(pdf_path, pdf_filename)
+    # Parse the PDF once with PyMuPDF and reuse it for both text and images
+    with fitz.open(pdf_path) as pdf_document:
+        extracted_text, _ = extract_text_from_pdf(pdf_document, template_text)
+        extracted_images = extract_images_from_pdf(pdf_document, pdf_filename)
 
     # Prepare base JSON structure
     result = {
@@ -295,29 +395,53 @@ def process_pdf(pdf_file):
         "images": extracted_images        # Store extracted images
     }
 
-    # ✅ First, save extracted text & images to JSON
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, indent=4)
-
-    # ✅ Now, reload the updated JSON
-    with open(json_path, "r", encoding="utf-8") as f:
-        json_data = json.load(f)
-
-    # ✅ Extract firm info using the updated JSON
-    firm_info = extract_firm_info(json_data)
+    # ✅ Extract firm info straight from the in-memory result (saved once by the parent)
+    firm_info = extract_firm_info(result)
     result["firm_info"] = firm_info
 
-    # ✅ Save final JSON file with firm info
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, indent=4)
-
-    print(f"✅ Processed {pdf_file}: Extracted firm information and images.")
+    return result
+
+def drop_repeated_images(result):
+    """Drop images whose hash has already been seen too often across all processed PDFs."""
+    images = result["images"]
+    keep = []
+    for idx, img_hash in enumerate(images["hash"]):
+        image_hash_tree.add(img_hash)
+        if image_hash_tree.count_within(img_hash, IMAGE_HASH_MAX_DISTANCE) > MAX_IMAGE_REPEATS:
+            print(f"⚠️ Skipping repeated image (Hash: {img_hash:016x}) on Page {images['page'][idx]}")
+            os.remove(os.path.join(IMAGE_OUTPUT_DIRECTORY, images["image_file"][idx]))
+            continue
+        keep.append(idx)
+    result["images"] = {key: [column[idx] for idx in keep] for key, column in images.items()}
+
+def result_to_json(result):
+    """Serialize a result to JSON bytes, formatting the integer image hashes as hex strings."""
+    images = result["images"]
+    hex_hashes = [f"{img_hash:016x}" for img_hash in images["hash"]]
+    return orjson.dumps({**result, "images": {**images, "hash": hex_hashes}}, option=JSON_OPTIONS)
+
+def save_result(result):
+    """Save the final JSON file for a processed PDF."""
+    pdf_filename = os.path.splitext(result["filename"])[0]
+    json_path = os.path.join(OUTPUT_DIRECTORY, pdf_filename + ".json")
+    with open(json_path, "wb") as f:
+        f.write(result_to_json(result))
 
 def main():
-    """Main function to process all PDFs in the directory."""
-    for pdf_file in os.listdir(PDF_DIRECTORY):
-        if pdf_file.lower().endswith(".pdf"):
-            process_pdf(pdf_file)
+    """Main function to process all PDFs in the directory in parallel."""
+    with os.scandir(PDF_DIRECTORY) as entries:
+        pdf_files = sorted(entry.name for entry in entries if entry.is_file() and entry.name.lower().endswith(".pdf"))
+
+    template_text = load_template_text()  # Read once here instead of once per PDF
+
+    # Workers extract text and images; repeated-image filtering needs counts across
+    # every PDF, so it runs here in the parent. imap hands results over in pdf_files
+    # order, so the same PDFs keep a repeated image on every run.
+    with multiprocessing.Pool(NUM_WORKERS, initializer=init_worker, initargs=(template_text,)) as pool:
+        for result in pool.imap(process_pdf, pdf_files):
+            drop_repeated_images(result)
+            save_result(result)
+            print(f"✅ Processed {result['filename']}: Extracted firm information and images.")
 
 if __name__ == "__main__":
     main()
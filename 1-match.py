@@ -1,8 +1,11 @@
 import os
-import json
+import orjson
 import csv
+import numpy as np
+import scipy.sparse
 from difflib import SequenceMatcher
 from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
 import random
 from datetime import datetime
 
@@ -11,11 +14,14 @@ timestamp = datetime.now().strftime("%Y%m%d_%H%M")
 CSV_OUTPUT_FILE = f"./pdf_comparison_{timestamp}.csv"
 
 TEST_MODE = False  # Set to False to process all files
+USE_SEQUENCE_MATCHER = False  # Set to True for character-level SequenceMatcher scores (much slower)
+NGRAM_SIZE = 5  # Words per shingle for the default n-gram Jaccard text similarity
+NUM_WORKERS = os.cpu_count()  # Worker processes for the SequenceMatcher scores
 # Paths
 OUTPUT_DIRECTORY = "./processed_data"
 
 def load_json_files():
-    """Load extracted JSON files from the output directory with progress updates."""
+    """Load each extracted JSON file's joined text and image hashes with progress updates."""
     json_data = {}
 
     # Files that must be included in the test
@@ -28,18 +34,23 @@ def load_json_files():
         "docNAC01FB74535356434423e0710933c37c87ef29b807bfe7da71dd9f7253130b0903ad3bc99acf.json"
     }
 
-    # Get all JSON files in the directory
-    all_files = [f for f in os.listdir(OUTPUT_DIRECTORY) if f.endswith(".json")]
+    # Get all JSON files in the directory (name -> full path)
+    with os.scandir(OUTPUT_DIRECTORY) as entries:
+        json_paths = {entry.name: entry.path for entry in entries if entry.is_file() and entry.name.endswith(".json")}
+    all_files = list(json_paths)
 
-    # Ensure required files are present in the directory
-    valid_required_files = [f for f in all_files if f in required_files]
+    if TEST_MODE:
+        # Ensure required files are present in the directory
+        valid_required_files = [f for f in all_files if f in required_files]
 
-    # Select 3 additional random files
-    remaining_files = list(set(all_files) - set(valid_required_files))
-    random_files = random.sample(remaining_files, min(1, len(remaining_files)))
+        # Select 1 additional random file
+        remaining_files = [f for f in all_files if f not in required_files]
+        random_files = random.sample(remaining_files, min(1, len(remaining_files)))
 
-    # Combine required files and random files
-    files = all_files if not TEST_MODE else (valid_required_files + random_files)
+        # Combine required files and random files
+        files = valid_required_files + random_files
+    else:
+        files = all_files
 
     if not files:
         print("⚠️ No JSON files found in the output directory.")
@@ -48,42 +59,96 @@ def load_json_files():
     print(f"📂 Found {len(files)} JSON files for testing. Loading data...")
 
     for file in files:
-        with open(os.path.join(OUTPUT_DIRECTORY, file), "r", encoding="utf-8") as f:
-            json_data[file] = json.load(f)
+        with open(json_paths[file], "rb") as f:
+            document = orjson.loads(f.read())
+
+        # Keep only what the comparison needs: the joined text and the set of image hashes
+        json_data[file] = {
+            "text": " ".join(document.get("text_by_page", {}).values()),
+            "image_hashes": set(document.get("images", {}).get("hash", [])),
+        }
 
     print(f"✅ Loaded {len(json_data)} JSON files successfully.")
     return json_data
 
-def compute_text_similarity(text1, text2):
-    """Compute similarity score between two text contents using SequenceMatcher."""
-    return SequenceMatcher(None, text1, text2).ratio() * 100  # Convert to percentage
-
-def compute_image_similarity(images1, images2):
-    """Compute image similarity based on matching perceptual hashes."""
-    if not images1 or not images2:
-        return 0.0  # No images to compare
-    
-    hashes1 = {img["hash"] for img in images1}
-    hashes2 = {img["hash"] for img in images2}
-    common_hashes = hashes1.intersection(hashes2)
-    total_hashes = len(hashes1.union(hashes2))
-    
-    return (len(common_hashes) / total_hashes) * 100 if total_hashes > 0 else 0.0
+def get_ngrams(text, n=5):
+    words = text.split()
+    if len(words) < n:
+        return set()
+    return {" ".join(words[i:i+n]) for i in range(len(words)-n+1)}
+
+def compute_jaccard_matrix(item_sets):
+    """Compute pairwise Jaccard similarity (percentage) of all sets at once; pairs involving an empty set score 0."""
+    # Sparse document x item incidence matrix; its Gram matrix holds every pairwise intersection size
+    columns = {}
+    rows, cols = [], []
+    for row, items in enumerate(item_sets):
+        for item in items:
+            rows.append(row)
+            cols.append(columns.setdefault(item, len(columns)))
+    incidence = scipy.sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                                        shape=(len(item_sets), len(columns)))
+    common = (incidence @ incidence.T).toarray()
+
+    sizes = np.diag(common)
+    union = sizes[:, None] + sizes[None, :] - common
+    both_nonempty = (sizes[:, None] > 0) & (sizes[None, :] > 0)
+    return np.divide(common, union, out=np.zeros(common.shape), where=both_nonempty) * 100
+
+def compute_text_similarity(text1, matcher2):
+    """Compute similarity score between text1 and the text already indexed as seq2 of a SequenceMatcher."""
+    if text1 == matcher2.b:
+        return 100.0  # Identical documents (e.g. the same PDF submitted twice) need no diff
+    matcher2.set_seq1(text1)  # Only seq1 changes; the seq2 index built once per document is reused
+    return matcher2.ratio() * 100  # Convert to percentage
+
+# Document texts shared with each worker process once, via the pool initializer
+worker_texts = []
+
+def init_worker(texts):
+    """Store the document texts in the worker so tasks only carry a document index."""
+    global worker_texts
+    worker_texts = texts
+
+def score_against_document(j):
+    """Score every earlier document against document j, indexing j as seq2 only once."""
+    matcher2 = SequenceMatcher(None, "", worker_texts[j])
+    return j, [compute_text_similarity(worker_texts[i], matcher2) for i in range(j)]
+
+def compute_sequence_matcher_matrix(texts):
+    """Compute pairwise SequenceMatcher similarity (percentage) across all CPU cores."""
+    scores = np.zeros((len(texts), len(texts)))
+    with ProcessPoolExecutor(max_workers=NUM_WORKERS, initializer=init_worker, initargs=(texts,)) as executor:
+        # One task per document column; the longest columns go first so they don't straggle at the end
+        for j, column in executor.map(score_against_document, range(len(texts) - 1, 0, -1)):
+            scores[:j, j] = column
+    return scores
 
 def compare_pdfs(json_data):
     """Compare each pair of PDFs and store similarity scores with live updates."""
     results = []
-    total_pairs = sum(1 for _ in combinations(json_data.items(), 2))
+    total_pairs = len(json_data) * (len(json_data) - 1) // 2
     print(f"🔄 Starting PDF comparisons... {total_pairs} total pairs to compare.")
 
-    for idx, ((file1, data1), (file2, data2)) in enumerate(combinations(json_data.items(), 2), start=1):
-        # Extract text from pages
-        text1 = " ".join(data1.get("text_by_page", {}).values())
-        text2 = " ".join(data2.get("text_by_page", {}).values())
-        text_similarity = compute_text_similarity(text1, text2)
+    files = list(json_data)
+
+    texts = [json_data[file]["text"] for file in files]
+
+    if USE_SEQUENCE_MATCHER:
+        # Score all pairs in parallel, indexing each document once as seq2
+        text_scores = compute_sequence_matcher_matrix(texts)
+    else:
+        # Shingle each document once and score every pair in one sparse matrix product
+        text_scores = compute_jaccard_matrix([set(map(hash, get_ngrams(text, NGRAM_SIZE))) for text in texts])
+
+    # Image similarity is the Jaccard overlap of each document's perceptual hashes
+    image_scores = compute_jaccard_matrix([json_data[file]["image_hashes"] for file in files])
+
+    for idx, (i, j) in enumerate(combinations(range(len(files)), 2), start=1):
+        file1, file2 = files[i], files[j]
 
-        # Extract image data
-        image_similarity = compute_image_similarity(data1.get("images", []), data2.get("images", []))
+        text_similarity = float(text_scores[i, j])
+        image_similarity = float(image_scores[i, j])
 
         # Compute overall match score (weighted average, tweak as needed)
         overall_match = (0.7 * text_similarity) + (0.3 * image_similarity)
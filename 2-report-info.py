@@ -1,11 +1,18 @@
 import os
-import json
+import pandas as pd
+import orjson
 import csv
 import re
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 PROCESSED_DIRECTORY = "./processed_data"
 CSV_DIRECTORY = "."  # Assuming CSVs are stored in the current directory
+PDF_COMPARISON_RE = re.compile(r"pdf_comparison_(\d{8}_\d{4})\.csv$")  # Captures the report timestamp
+CONTACT_INFO_RE = re.compile(r"Contact Information(.*?)Form Generated on", re.DOTALL)
+WHITESPACE_RE = re.compile(r"\s+")
+EMPTY_FIRM = {"company": "N/A", "address": "N/A", "website": "N/A", "name": "N/A", "phone": "N/A"}  # Files without firm info
+DEBUG = False  # Set to True to print per-file firm info decisions and the first rows of the written report
 
 # Generate timestamp for the output file
 timestamp = datetime.now().strftime("%Y%m%d_%H%M")
@@ -13,11 +20,11 @@ CSV_OUTPUT_FILE = f"./pdf_comparison_{timestamp}.csv"
 
 def find_latest_pdf_comparison():
     """Find the most recent pdf_comparison_YYYYMMDD_HHMM.csv file."""
-    csv_files = [f for f in os.listdir(CSV_DIRECTORY) if re.match(r'pdf_comparison_\d{8}_\d{4}\.csv$', f)]
+    csv_files = [(m.group(1), f) for f in os.listdir(CSV_DIRECTORY) if (m := PDF_COMPARISON_RE.match(f))]
     if not csv_files:
         raise FileNotFoundError("No pdf_comparison_YYYYMMDD_HHMM.csv files found.")
     
-    latest_file = max(csv_files, key=lambda x: x.split("_")[-1].split(".")[0])  # Sort by timestamp
+    latest_file = max(csv_files)[1]  # Fixed-width YYYYMMDD_HHMM timestamps sort chronologically as text
     print(f"[INFO] Using latest PDF comparison file: {latest_file}")
     return os.path.join(CSV_DIRECTORY, latest_file)
 
@@ -32,7 +39,7 @@ def sanitize_csv_text(text):
         return "N/A"
     
     # Remove excessive whitespace and replace newlines with spaces
-    sanitized_text = re.sub(r'\s+', ' ', text).strip()
+    sanitized_text = WHITESPACE_RE.sub(' ', text).strip()
     
     # Escape double quotes and wrap in quotes if it contains commas
     if ',' in sanitized_text or '"' in sanitized_text:
@@ -40,69 +47,85 @@ def sanitize_csv_text(text):
     
     return sanitized_text
 
-def load_firm_info():
-    """Load firm contact info from JSON files and use extracted text as a fallback when necessary."""
-    firm_data = {}
-
-    for file in os.listdir(PROCESSED_DIRECTORY):
-        if file.endswith(".json") and file != "template_text.json":  # Ignore template_text.json
-            with open(os.path.join(PROCESSED_DIRECTORY, file), "r", encoding="utf-8") as f:
-                json_data = json.load(f)
-                firm_info = json_data.get("firm_info", {})
-
-                # Identify missing fields
-                missing_fields = [
-                    field for field in ["company", "address", "website", "name", "phone"]
-                    if firm_info.get(field, "N/A") in ("", "N/A")
-                ]
-
-                extracted_contact_info = "N/A"
-                used_fallback = False  # Track if fallback was used
-
-                if missing_fields:  # If any field is missing, trigger fallback extraction
-                    raw_text = ""
-
-                    # 🔹 Extract text from all pages and concatenate
-                    if "text_by_page" in json_data:
-                        raw_text = " ".join(json_data["text_by_page"].values())
-
-                    # 🔹 Attempt extraction using regex
-                    match = re.search(r"Contact Information(.*?)Form Generated on", raw_text, re.DOTALL)
-
-                    if match:
-                        extracted_contact_info = match.group(1).strip()
-                        extracted_contact_info = sanitize_csv_text(extracted_contact_info)
-                        used_fallback = True
-                        
-                        print(f"[DEBUG] Extracted text for {file} (before sanitization):")
-                        print(match.group(1)[:500])  # Show first 500 characters
-                        print(f"[DEBUG] Extracted text for {file} (sanitized): {extracted_contact_info}")
-
-                    else:
-                        print(f"[WARN] No firm info found in {file}, and no extractable text.")
-
-                # Debug print: Show the decision-making process
-                if used_fallback:
-                    print(f"[DEBUG] Using extracted text for {file} because missing fields: {', '.join(missing_fields)}")
-                    firm_data[file] = {
-                        "company": extracted_contact_info,
-                        "address": "N/A",
-                        "website": "N/A",
-                        "name": "N/A",
-                        "phone": "N/A",
-                    }
-                else:
-                    print(f"[DEBUG] Using structured firm info for {file}. All fields present.")
-                    firm_data[file] = {
-                        "company": firm_info.get("company", "N/A"),
-                        "address": firm_info.get("address", "N/A"),
-                        "website": firm_info.get("website", "N/A"),
-                        "name": firm_info.get("name", "N/A"),
-                        "phone": firm_info.get("phone", "N/A"),
-                    }
-
-                print(f"[INFO] Final firm info for {file}: {firm_data[file]}")
+def load_file_firm_info(file, path):
+    """Load one file's firm contact info, using its extracted text as a fallback when fields are missing."""
+    with open(path, "rb") as f:
+        json_data = orjson.loads(f.read())
+
+    firm_info = json_data.get("firm_info", {})
+
+    # Identify missing fields
+    missing_fields = [
+        field for field in ["company", "address", "website", "name", "phone"]
+        if firm_info.get(field, "N/A") in ("", "N/A")
+    ]
+
+    extracted_contact_info = "N/A"
+    used_fallback = False  # Track if fallback was used
+
+    if missing_fields:  # If any field is missing, trigger fallback extraction
+        raw_text = ""
+
+        # 🔹 Extract text from all pages and concatenate
+        if "text_by_page" in json_data:
+            raw_text = " ".join(json_data["text_by_page"].values())
+
+        # 🔹 Attempt extraction using regex
+        match = CONTACT_INFO_RE.search(raw_text)
+
+        if match:
+            extracted_contact_info = match.group(1).strip()
+            extracted_contact_info = sanitize_csv_text(extracted_contact_info)
+            used_fallback = True
+
+            if DEBUG:
+                print(f"[DEBUG] Extracted text for {file} (before sanitization):")
+                print(match.group(1)[:500])  # Show first 500 characters
+                print(f"[DEBUG] Extracted text for {file} (sanitized): {extracted_contact_info}")
+
+        else:
+            print(f"[WARN] No firm info found in {file}, and no extractable text.")
+
+    # Debug print: Show the decision-making process
+    if used_fallback:
+        if DEBUG:
+            print(f"[DEBUG] Using extracted text for {file} because missing fields: {', '.join(missing_fields)}")
+        firm = {
+            "company": extracted_contact_info,
+            "address": "N/A",
+            "website": "N/A",
+            "name": "N/A",
+            "phone": "N/A",
+        }
+    else:
+        if DEBUG:
+            print(f"[DEBUG] Using structured firm info for {file}. All fields present.")
+        firm = {
+            "company": firm_info.get("company", "N/A"),
+            "address": firm_info.get("address", "N/A"),
+            "website": firm_info.get("website", "N/A"),
+            "name": firm_info.get("name", "N/A"),
+            "phone": firm_info.get("phone", "N/A"),
+        }
+
+    if DEBUG:
+        print(f"[INFO] Final firm info for {file}: {firm}")
+    return firm
 
+def load_firm_info():
+    """Load firm contact info from JSON files in parallel and use extracted text as a fallback when necessary."""
+    with os.scandir(PROCESSED_DIRECTORY) as entries:
+        json_paths = {entry.name: entry.path for entry in entries if entry.is_file() and entry.name.endswith(".json")}
+    files = [file for file in json_paths if file != "template_text.json"]  # Ignore template_text.json
+
+    # Each worker parses a share of the files and sends back only the small firm info dicts
+    num_workers = os.cpu_count()
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        firm_infos = executor.map(load_file_firm_info, files, [json_paths[file] for file in files],
+                                  chunksize=max(1, len(files) // (num_workers * 4)))
+        firm_data = dict(zip(files, firm_infos))
+
+    print(f"[INFO] Loaded firm info for {len(firm_data)} files")
     return firm_data
     
 def update_summary_with_contacts():
@@ -110,15 +133,12 @@ def update_summary_with_contacts():
     csv_file = find_latest_pdf_comparison()
     print(f"[INFO] Reading PDF comparison data from {csv_file}")
     
-    with open(csv_file, "r", newline="", encoding="utf-8") as infile:
-        reader = csv.reader(infile)
-        header = next(reader)
-        rows = list(reader)
-
-    overall_match_index = header.index("Overall_Match (%)")
+    # Every column is read as text so rows are written back exactly as they were read
+    comparison_df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+    header = comparison_df.columns.tolist()
     
-    # Filter rows based on the Overall_Match threshold
-    filtered_rows = [row for row in rows if float(row[overall_match_index]) >= 50.01]
+    # Filter rows based on the Overall_Match threshold with one vectorized comparison
+    filtered_rows = comparison_df[comparison_df["Overall_Match (%)"].astype(float) >= 50.01].values.tolist()
     print(f"[INFO] Filtered rows count: {len(filtered_rows)}")
 
     if not filtered_rows:
@@ -132,37 +152,35 @@ def update_summary_with_contacts():
 
     def get_firm_info(firm):
         """Ensure extracted text is used when structured data is missing."""
-        company = firm["company"] if firm["company"] and firm["company"] != "N/A" else "N/A"
-        return [company, firm["address"], firm["website"], firm["name"], firm["phone"]]
-
-    new_rows = []
-    for row in filtered_rows:
-        file1, file2 = row[:2]
-        
-        firm1 = firm_data.get(file1, {"company": "N/A", "address": "N/A", "website": "N/A", "name": "N/A", "phone": "N/A"})
-        firm2 = firm_data.get(file2, {"company": "N/A", "address": "N/A", "website": "N/A", "name": "N/A", "phone": "N/A"})
-        
-        new_row = row + get_firm_info(firm1) + get_firm_info(firm2)
-        new_rows.append(new_row)
+        return [firm["company"] or "N/A", firm["address"], firm["website"], firm["name"], firm["phone"]]
 
     print(f"[INFO] Writing updated summary report to {CSV_OUTPUT_FILE}")
-    with open(CSV_OUTPUT_FILE, "w", newline="", encoding="utf-8") as outfile:
+    with open(CSV_OUTPUT_FILE, "w", newline="", encoding="utf-8", buffering=1 << 20) as outfile:
         writer = csv.writer(outfile)
         writer.writerow(new_header)
-        writer.writerows(new_rows)
+
+        # Rows are written as they are built rather than collected into a second list first
+        for row in filtered_rows:
+            file1, file2 = row[:2]
+
+            firm1 = firm_data.get(file1, EMPTY_FIRM)
+            firm2 = firm_data.get(file2, EMPTY_FIRM)
+
+            writer.writerow(row + get_firm_info(firm1) + get_firm_info(firm2))
     
     print(f"[INFO] Updated summary report saved to {CSV_OUTPUT_FILE}")
 
-    # Debug: Print first few rows from the output CSV
-    print("[DEBUG] First few rows of the output CSV:")
-    with open(CSV_OUTPUT_FILE, "r", newline="", encoding="utf-8") as outfile:
-        reader = csv.reader(outfile)
-        output_header = next(reader)
-        print(output_header)
-        for i, row in enumerate(reader):
-            print(row)
-            if i >= 4:  # Limit to first 5 rows
-                break
+    if DEBUG:
+        # Debug: Print first few rows from the output CSV
+        print("[DEBUG] First few rows of the output CSV:")
+        with open(CSV_OUTPUT_FILE, "r", newline="", encoding="utf-8") as outfile:
+            reader = csv.reader(outfile)
+            output_header = next(reader)
+            print(output_header)
+            for i, row in enumerate(reader):
+                print(row)
+                if i >= 4:  # Limit to first 5 rows
+                    break
 
 if __name__ == "__main__":
     update_summary_with_contacts()
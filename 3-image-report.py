@@ -1,11 +1,14 @@
 import os
-import json
+import orjson
 import csv
 import re
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 PROCESSED_DIRECTORY = "./processed_data"
 CSV_DIRECTORY = "."  # Where the previous CSVs are stored
+PDF_COMPARISON_RE = re.compile(r"pdf_comparison_(\d{8}_\d{4})\.csv$")  # Captures the report timestamp
+DEBUG = False  # Set to True to print every PDF pair as it is processed
 
 # Generate timestamp for the output file
 timestamp = datetime.now().strftime("%Y%m%d_%H%M")
@@ -13,78 +16,89 @@ CSV_OUTPUT_FILE = f"./image_matches_{timestamp}.csv"
 
 def find_latest_pdf_comparison():
     """Find the most recent pdf_comparison_YYYYMMDD_HHMM.csv file."""
-    csv_files = [f for f in os.listdir(CSV_DIRECTORY) if re.match(r'pdf_comparison_\d{8}_\d{4}\.csv$', f)]
+    csv_files = [(m.group(1), f) for f in os.listdir(CSV_DIRECTORY) if (m := PDF_COMPARISON_RE.match(f))]
     if not csv_files:
         raise FileNotFoundError("No pdf_comparison_YYYYMMDD_HHMM.csv files found.")
     
-    latest_file = max(csv_files, key=lambda x: x.split("_")[-1].split(".")[0])  # Sort by timestamp
+    latest_file = max(csv_files)[1]  # Fixed-width YYYYMMDD_HHMM timestamps sort chronologically as text
     print(f"Using latest PDF comparison file: {latest_file}")
     return os.path.join(CSV_DIRECTORY, latest_file)
 
 def load_json_data(file_path):
-    """Load JSON data from a given file."""
+    """Load the column-oriented image data ("page", "hash", "position", ...) from a given file."""
     if not os.path.exists(file_path):
         print(f"Warning: JSON file {file_path} not found.")
-        return []
+        return {}
     
-    with open(file_path, "r", encoding="utf-8") as f:
+    with open(file_path, "rb") as f:
         try:
-            return json.load(f).get("images", [])
-        except json.JSONDecodeError:
+            return orjson.loads(f.read()).get("images", {})
+        except orjson.JSONDecodeError:
             print(f"Error: Unable to parse JSON file {file_path}")
-            return []
+            return {}
 
-def extract_matching_images():
-    """Extract matching image information from JSON files and save it to a CSV."""
-    csv_file = find_latest_pdf_comparison()
-    print(f"Reading PDF comparison data from {csv_file}")
-
-    with open(csv_file, "r", newline="", encoding="utf-8") as infile:
-        reader = csv.reader(infile)
-        header = next(reader)
-        rows = list(reader)
-
-    matching_images = []
+def load_image_index(file_path):
+    """Map each image hash of a processed JSON file to its (page, position) for quick lookup."""
+    images = load_json_data(file_path)
+    return {h: (page, pos) for h, page, pos in
+            zip(images.get("hash", []), images.get("page", []), images.get("position", []))}
 
+def iter_matching_images(rows, image_hashes):
+    """Yield a CSV row for every image hash shared by the two PDFs of each comparison row."""
     for row in rows:
         pdf_1 = row[0]  # First PDF
         pdf_2 = row[1]  # Second PDF
 
-        print(f"Processing matching PDFs: {pdf_1} & {pdf_2}")
-
-        # Load image data from corresponding JSON files
-        json_file_1 = os.path.join(PROCESSED_DIRECTORY, pdf_1)
-        json_file_2 = os.path.join(PROCESSED_DIRECTORY, pdf_2)
+        if DEBUG:
+            print(f"Processing matching PDFs: {pdf_1} & {pdf_2}")
 
-        images_1 = load_json_data(json_file_1)
-        images_2 = load_json_data(json_file_2)
+        image_hashes_1 = image_hashes[pdf_1]
+        image_hashes_2 = image_hashes[pdf_2]
 
-        # Create a dictionary of hashes for quick lookup
-        image_hashes_1 = {img["hash"]: img for img in images_1}
-        image_hashes_2 = {img["hash"]: img for img in images_2}
+        # Find matching image hashes by probing the second document's index, in first-document order
+        for img_hash, img_data_1 in image_hashes_1.items():
+            img_data_2 = image_hashes_2.get(img_hash)
+            if img_data_2 is None:
+                continue
 
-        # Find matching image hashes
-        common_hashes = set(image_hashes_1.keys()) & set(image_hashes_2.keys())
-
-        for img_hash in common_hashes:
-            img_data_1 = image_hashes_1[img_hash]
-            img_data_2 = image_hashes_2[img_hash]
-
-            matching_images.append([
+            yield [
                 pdf_1, pdf_2,
-                img_data_1["page"], img_data_1["position"],
-                img_data_2["page"], img_data_2["position"]
-            ])
+                *img_data_1,  # Page, position
+                *img_data_2
+            ]
 
-    if not matching_images:
+def extract_matching_images():
+    """Extract matching image information from JSON files and save it to a CSV."""
+    csv_file = find_latest_pdf_comparison()
+    print(f"Reading PDF comparison data from {csv_file}")
+
+    with open(csv_file, "r", newline="", encoding="utf-8") as infile:
+        reader = csv.reader(infile)
+        header = next(reader)
+        rows = list(reader)
+    print(f"Processing {len(rows)} matching PDF pairs")
+
+    # Load each JSON file once, however many pairs it appears in, spreading the parsing across all cores
+    json_files = list(dict.fromkeys(pdf for row in rows for pdf in row[:2]))
+    num_workers = os.cpu_count()
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        image_indexes = executor.map(load_image_index, [os.path.join(PROCESSED_DIRECTORY, pdf) for pdf in json_files],
+                                     chunksize=max(1, len(json_files) // (num_workers * 4)))
+        image_hashes = dict(zip(json_files, image_indexes))
+
+    # Matches are written as they are found; the output file is only created once there is a first match
+    matching_images = iter_matching_images(rows, image_hashes)
+    first_match = next(matching_images, None)
+    if first_match is None:
         print("No matching images found. Exiting.")
         return
 
     # Write results to the output CSV
     print(f"Writing matching images to {CSV_OUTPUT_FILE}")
-    with open(CSV_OUTPUT_FILE, "w", newline="", encoding="utf-8") as outfile:
+    with open(CSV_OUTPUT_FILE, "w", newline="", encoding="utf-8", buffering=1 << 20) as outfile:
         writer = csv.writer(outfile)
         writer.writerow(["PDF1", "PDF2", "PDF1_PageNum", "PDF1_Position", "PDF2_PageNum", "PDF2_Position"])
+        writer.writerow(first_match)
         writer.writerows(matching_images)
 
     print(f"Matching images saved to {CSV_OUTPUT_FILE}")
@@ -1,9 +1,11 @@
 import os
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 import re
 from datetime import datetime
+from functools import lru_cache
 
 PROCESSED_DIRECTORY = "./processed_data"
 CSV_DIRECTORY = "."  # Where the CSVs are stored
@@ -12,13 +14,27 @@ CSV_DIRECTORY = "."  # Where the CSVs are stored
 timestamp = datetime.now().strftime("%Y%m%d_%H%M")
 OUTPUT_EXCEL_FILE = f"./formatted_report_{timestamp}.xlsx"
 
+# Styles are created once and shared by every cell; headers keep the look DataFrame.to_excel gave them
+HEADER_FONT = Font(bold=True)
+HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
+HEADER_BORDER = Border(left=Side(style="thin"), right=Side(style="thin"), top=Side(style="thin"), bottom=Side(style="thin"))
+HEADER_FILL = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+CENTER_ALIGNMENT = Alignment(horizontal="center")
+GROUP_FILLS = [PatternFill(start_color=color, end_color=color, fill_type="solid") for color in ("FFD700", "87CEEB")]  # Alternating colors for groups
+
+@lru_cache(maxsize=None)
+def report_file_re(prefix):
+    """Compile, once per prefix, the pattern matching {prefix}_YYYYMMDD_HHMM.csv and capturing its timestamp."""
+    return re.compile(fr"{prefix}_(\d{{8}}_\d{{4}})\.csv$")
+
 def find_latest_file(prefix):
     """Find the most recent file matching the given prefix."""
-    csv_files = [f for f in os.listdir(CSV_DIRECTORY) if re.match(fr'{prefix}_\d{{8}}_\d{{4}}\.csv$', f)]
+    pattern = report_file_re(prefix)
+    csv_files = [(m.group(1), f) for f in os.listdir(CSV_DIRECTORY) if (m := pattern.match(f))]
     if not csv_files:
         raise FileNotFoundError(f"No {prefix}_YYYYMMDD_HHMM.csv files found.")
     
-    latest_file = max(csv_files, key=lambda x: x.split("_")[-1].split(".")[0])  # Sort by timestamp
+    latest_file = max(csv_files)[1]  # Fixed-width YYYYMMDD_HHMM timestamps sort chronologically as text
     print(f"Using latest {prefix} file: {latest_file}")
     return os.path.join(CSV_DIRECTORY, latest_file)
 
@@ -26,6 +42,26 @@ def count_files_in_directory(directory):
     """Count the number of JSON files in the processed directory (representing original PDFs)."""
     return len([f for f in os.listdir(directory) if f.endswith(".json")])
 
+def dataframe_rows(df):
+    """Return a DataFrame's rows as tuples of plain values, with missing values left as empty cells."""
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+def styled_cells(sheet, values, font=None, fill=None, alignment=None, border=None):
+    """Wrap a row of values in write-only cells carrying the given shared styles."""
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(sheet, value=value)
+        if font is not None:
+            cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        if alignment is not None:
+            cell.alignment = alignment
+        if border is not None:
+            cell.border = border
+        cells.append(cell)
+    return cells
+
 def process_and_format_excel():
     """Create an Excel report with Summary, PDF Comparison, and Image Matches reports."""
     
@@ -54,51 +90,36 @@ def process_and_format_excel():
     }
     summary_df = pd.DataFrame(summary_data)
 
-    # Create Excel writer
-    with pd.ExcelWriter(OUTPUT_EXCEL_FILE, engine="openpyxl") as writer:
-        # Write Summary Report
-        summary_df.to_excel(writer, sheet_name="Summary", index=False)
-        workbook = writer.book
-        summary_sheet = writer.sheets["Summary"]
-
-        # Format Summary Sheet
-        summary_sheet["A1"].font = Font(bold=True)
-        summary_sheet["B1"].font = Font(bold=True)
-        for row in summary_sheet.iter_rows(min_row=2, max_row=summary_sheet.max_row, min_col=1, max_col=2):
-            for cell in row:
-                cell.alignment = Alignment(horizontal="center")
-        
-        # Write PDF Comparison Report
-        pdf_comparison_df.to_excel(writer, sheet_name="PDF Comparison", index=False)
-        pdf_sheet = writer.sheets["PDF Comparison"]
-
-        # Formatting PDF Comparison Sheet
-        header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-        header_font = Font(bold=True)
-        for col in range(1, pdf_sheet.max_column + 1):
-            pdf_sheet.cell(row=1, column=col).fill = header_fill
-            pdf_sheet.cell(row=1, column=col).font = header_font
-            pdf_sheet.cell(row=1, column=col).alignment = Alignment(horizontal="center")
-
-        # Write Image Matches Report
-        image_matches_df.to_excel(writer, sheet_name="Image Matches", index=False)
-        img_sheet = writer.sheets["Image Matches"]
-
-        # Formatting Image Matches Sheet
-        group_colors = ["FFD700", "87CEEB"]  # Alternating colors for groups
-        color_index = 0
-        current_group = None
-
-        for row in range(2, img_sheet.max_row + 1):
-            group_identifier = (img_sheet.cell(row=row, column=1).value, img_sheet.cell(row=row, column=2).value)
-
-            if group_identifier != current_group:
-                current_group = group_identifier
-                color_index = (color_index + 1) % len(group_colors)
-
-            fill_color = group_colors[color_index]
-            for col in range(1, img_sheet.max_column + 1):
-                img_sheet.cell(row=row, column=col).fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+    # Stream every sheet row by row through a write-only workbook instead of styling an in-memory one cell by cell
+    workbook = Workbook(write_only=True)
+
+    # Write Summary Report with centered values
+    summary_sheet = workbook.create_sheet("Summary")
+    summary_sheet.append(styled_cells(summary_sheet, summary_df.columns, HEADER_FONT, None, HEADER_ALIGNMENT, HEADER_BORDER))
+    for values in dataframe_rows(summary_df):
+        summary_sheet.append(styled_cells(summary_sheet, values, alignment=CENTER_ALIGNMENT))
+
+    # Write PDF Comparison Report with a shaded header
+    pdf_sheet = workbook.create_sheet("PDF Comparison")
+    pdf_sheet.append(styled_cells(pdf_sheet, pdf_comparison_df.columns, HEADER_FONT, HEADER_FILL, CENTER_ALIGNMENT, HEADER_BORDER))
+    for values in dataframe_rows(pdf_comparison_df):
+        pdf_sheet.append(values)
+
+    # Write Image Matches Report, alternating the fill for each PDF pair
+    img_sheet = workbook.create_sheet("Image Matches")
+    img_sheet.append(styled_cells(img_sheet, image_matches_df.columns, HEADER_FONT, None, HEADER_ALIGNMENT, HEADER_BORDER))
+    color_index = 0
+    current_group = None
+    for values in dataframe_rows(image_matches_df):
+        group_identifier = values[:2]
+
+        if group_identifier != current_group:
+            current_group = group_identifier
+            color_index = (color_index + 1) % len(GROUP_FILLS)
+
+        img_sheet.append(styled_cells(img_sheet, values, fill=GROUP_FILLS[color_index]))
+
+    workbook.save(OUTPUT_EXCEL_FILE)
 
     print(f"Formatted Excel report saved to {OUTPUT_EXCEL_FILE}")
 
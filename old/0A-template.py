@@ -1,86 +1,129 @@
 import os
 import re
-import json
-from collections import defaultdict
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer
+import hashlib
+import unicodedata
+import orjson
+import multiprocessing
+from collections import Counter
+import fitz  # PyMuPDF for extracting text
 
 # Directory paths
 PDF_DIRECTORY = "./test"
 OUTPUT_DIRECTORY = "./processed_data"
 OUTPUT_TEMPLATE_FILE = os.path.join(OUTPUT_DIRECTORY, "template_text.json")
+NUM_WORKERS = min(os.cpu_count() or 1, 8)  # Parallel PDF workers
+EXTRACT_CACHE_DIRECTORY = os.path.join(OUTPUT_DIRECTORY, ".extract_cache")  # Cleaned pages per PDF
+EXTRACT_CACHE_VERSION = 3  # Bump when extraction or cleaning changes to invalidate cached pages
+DEBUG = False  # Set to True to preview the filtered template text
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;:])\s+")  # Split after sentence-ending punctuation
+PUNCT_SPACING_RE = re.compile(r"([.,!?;:])(?=\S)")  # Punctuation directly followed by a non-space
+
+class _KeepCharsTable(dict):
+    """str.translate table that deletes everything outside [\\w\\s.,!?;:], filled in per codepoint on first use."""
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        keep = char.isalnum() or char.isspace() or char in "_.,!?;:"
+        self[codepoint] = codepoint if keep else None
+        return self[codepoint]
+
+KEEP_CHARS_TABLE = _KeepCharsTable()
 
 def clean_page_text(text):
     """Normalize page text while preserving punctuation and sentence structure."""
+    text = unicodedata.normalize("NFC", text)  # Composed and decomposed accents count as the same phrase
     text = text.lower().strip()
     
     # Preserve punctuation but remove unnecessary symbols
-    text = re.sub(r"[^\w\s.,!?;:]", "", text)  # Keep .,!?;: but remove other special chars
+    text = text.translate(KEEP_CHARS_TABLE)  # Keep .,!?;: but remove other special chars
     
     # Ensure proper spacing after punctuation
-    text = re.sub(r"([.,!?;:])([^\s])", r"\1 \2", text)  # Add space after punctuation if missing
+    text = PUNCT_SPACING_RE.sub(r"\1 ", text)  # Add space after punctuation if missing
     
     # Reduce excess spaces
-    text = re.sub(r"\s+", " ", text).strip()
+    text = " ".join(text.split())
     
     return text
 
 def extract_text_from_pdf(pdf_path):
     """Extract text from a PDF file while preserving page structure."""
     sentences_by_page = []
-    print(f"\n📄 Extracting text from: {pdf_path}")
-
-    for page_layout in extract_pages(pdf_path):
-        page_text = []
-        for element in page_layout:
-            if isinstance(element, LTTextContainer):
-                text = element.get_text().strip()
-                if text:
-                    page_text.append(text)
-
-        full_page_text = " ".join(page_text).strip()
-        if full_page_text:
-            full_page_text = clean_page_text(full_page_text)  # Clean text properly
-            sentences_by_page.append(full_page_text)
-
-    print(f"   ✅ Extracted {len(sentences_by_page)} pages.")
+
+    with fitz.open(pdf_path) as pdf_document:
+        for page in pdf_document:
+            full_page_text = page.get_text("text").strip()
+            if full_page_text:
+                full_page_text = clean_page_text(full_page_text)  # Clean text properly
+                sentences_by_page.append(full_page_text)
+
     return sentences_by_page  # Return cleaned text per page
 
-def find_common_text(pdf_files):
+def extract_cache_path(pdf_path):
+    """Cache file for a PDF, keyed by its first 4 KB, size and modification time."""
+    with open(pdf_path, "rb") as f:
+        head_digest = hashlib.sha1(f.read(4096)).hexdigest()
+    stat = os.stat(pdf_path)
+    cache_key = f"{head_digest}_{stat.st_size}_{stat.st_mtime_ns}_v{EXTRACT_CACHE_VERSION}"
+    return os.path.join(EXTRACT_CACHE_DIRECTORY, cache_key + ".json")
+
+def extract_text_cached(pdf_path):
+    """Return the cleaned pages of a PDF, reusing the on-disk result of a previous run if present."""
+    cache_path = extract_cache_path(pdf_path)
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            return orjson.loads(f.read())
+
+    pages = extract_text_from_pdf(pdf_path)
+
+    # Write then rename so an interrupted run never leaves a truncated cache entry
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(pages))
+    os.replace(tmp_path, cache_path)
+    return pages
+
+def extract_pdf_pages(pdf_path):
+    """Worker entry point: extract the cleaned pages of one PDF."""
+    return pdf_path, extract_text_cached(pdf_path)
+
+def find_common_text(pdf_paths):
     """Identify frequently occurring text across PDFs while preserving structure."""
-    phrase_count = defaultdict(int)
-    header_footer_count = defaultdict(int)
-    text_by_pdf = {}
-    total_pdfs = len(pdf_files)
+    phrase_count = Counter()
+    header_footer_count = Counter()
+    total_pdfs = len(pdf_paths)
 
     print("\n📊 Counting text occurrences across PDFs...")
 
     possible_headers_footers = set()
 
-    for pdf_index, pdf_file in enumerate(pdf_files):
-        pdf_path = os.path.join(PDF_DIRECTORY, pdf_file)
-        print(f"   🟢 Processing PDF {pdf_index+1}/{len(pdf_files)}: {pdf_file}")
-
-        pages = extract_text_from_pdf(pdf_path)  # Extract per-page text
-        text_by_pdf[pdf_file] = pages
-
-        for page_text in pages:
-            # Preserve punctuation so sentences remain intact
-            page_text = clean_page_text(page_text)
-            
-            # Split into properly structured sentences
-            sentences = [s.strip() for s in re.split(r"(?<=[.!?;:])\s+", page_text) if s.strip()]
+    # Extract PDFs in parallel; counting stays in the parent as results arrive and
+    # each PDF's pages are dropped once counted (Step 3 reads them back from the cache)
+    with multiprocessing.Pool(NUM_WORKERS) as pool:
+        extracted = pool.imap_unordered(extract_pdf_pages, pdf_paths, chunksize=1)
+        for pdf_index, (pdf_path, pages) in enumerate(extracted):
+            print(f"   🟢 Processing PDF {pdf_index+1}/{total_pdfs}: {os.path.basename(pdf_path)} ({len(pages)} pages)")
+
+            # Thresholds are fractions of PDFs, so count each phrase at most once per PDF
+            pdf_headers_footers = set()
+            pdf_phrases = set()
+
+            for page_text in pages:
+                # Pages are already cleaned (punctuation preserved) by extract_text_from_pdf
+                # Split into properly structured sentences
+                sentences = [s.strip() for s in SENTENCE_SPLIT_RE.split(page_text) if s.strip()]
             
-            # Store possible headers/footers (only if they appear in 50%+ PDFs)
-            if len(sentences) > 2:
-                header_footer_count[sentences[0]] += 1  # First sentence (header)
-                header_footer_count[sentences[-1]] += 1  # Last sentence (footer)
+                # Store possible headers/footers (only if they appear in 50%+ PDFs)
+                if len(sentences) > 2:
+                    pdf_headers_footers.add(sentences[0])  # First sentence (header)
+                    pdf_headers_footers.add(sentences[-1])  # Last sentence (footer)
+
+                # Collect phrases (for template detection)
+                words = page_text.split()
+                # Sliding window of 6 words, kept as word tuples (no joined strings)
+                pdf_phrases.update(zip(words, words[1:], words[2:], words[3:], words[4:], words[5:]))
 
-            # Count phrase frequency (for template detection)
-            words = page_text.split()
-            for i in range(len(words) - 6):  # Sliding window of 6 words
-                phrase = " ".join(words[i : i + 6])
-                phrase_count[phrase] += 1  
+            header_footer_count.update(pdf_headers_footers)
+            phrase_count.update(pdf_phrases)
 
     # === STEP 2: Identify Common Template Phrases (70%+ PDFs) ===
     header_footer_threshold = int(0.5 * total_pdfs)  # Must appear in 50%+ of PDFs
@@ -99,10 +142,10 @@ def find_common_text(pdf_files):
 
     # === STEP 3: Remove Only Template Parts, Not Whole Sentences ===
     filtered_text = []
-    for pdf_file, pages in text_by_pdf.items():
+    for pdf_path in pdf_paths:
+        pages = extract_text_cached(pdf_path)  # Cache hit from the pass above
         for page_text in pages:
-            page_text = clean_page_text(page_text)  # Ensure cleaned version is used
-            sentences = [s.strip() for s in re.split(r"(?<=[.!?;:])\s+", page_text) if s.strip()]
+            sentences = [s.strip() for s in SENTENCE_SPLIT_RE.split(page_text) if s.strip()]
 
             # **Remove First and Last Sentence of Every Paragraph**
             if len(sentences) > 2:
@@ -113,39 +156,40 @@ def find_common_text(pdf_files):
                 words = sentence.split()
 
                 # Step 3.1: If the sentence starts with a detected template phrase, remove only the first few words
-                for template_phrase in detected_template_phrases:
-                    template_words = template_phrase.split()
-                    if words[: len(template_words)] == template_words:  # If sentence starts with a template phrase
-                        words = words[len(template_words) :]  # Remove only the prefix
-                        break  # Stop checking once template prefix is removed
+                if tuple(words[:6]) in detected_template_phrases:  # Every phrase is a 6-word tuple
+                    words = words[6:]  # Remove only the prefix
 
                 cleaned_sentences.append(" ".join(words))  # Keep the remaining content
 
             if cleaned_sentences:
                 filtered_text.append(". ".join(cleaned_sentences))  # Reconstruct cleaned text
 
+    print(f"\n✅ Kept {len(filtered_text)} unique text items after smart filtering.")
+
     # Debug: Show first 10 retained phrases
-    print(f"\n✅ Kept {len(filtered_text)} unique text items after smart filtering. Showing first 10:")
-    for snippet in filtered_text[:10]:
-        print(f"   - {snippet[:100]}...")  # Print first 100 chars
+    if DEBUG:
+        for snippet in filtered_text[:10]:
+            print(f"   - {snippet[:100]}...")  # Print first 100 chars
 
     return filtered_text
 
 def main():
     """Run the template text extraction process."""
     os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)  # Ensure directory exists
+    os.makedirs(EXTRACT_CACHE_DIRECTORY, exist_ok=True)
 
-    pdf_files = [f for f in os.listdir(PDF_DIRECTORY) if f.endswith(".pdf")]
+    with os.scandir(PDF_DIRECTORY) as entries:
+        pdf_paths = [entry.path for entry in entries if entry.is_file() and entry.name.lower().endswith(".pdf")]
     
-    if len(pdf_files) < 2:
+    if len(pdf_paths) < 2:
         print("⚠️ Not enough PDFs to detect template text. At least 2 required.")
         return
 
-    common_template_text = find_common_text(pdf_files)
+    common_template_text = find_common_text(pdf_paths)
 
     # Save the template text to a file
-    with open(OUTPUT_TEMPLATE_FILE, "w", encoding="utf-8") as f:
-        json.dump({"template_text": common_template_text}, f, indent=4)
+    with open(OUTPUT_TEMPLATE_FILE, "wb") as f:
+        f.write(orjson.dumps({"template_text": common_template_text}, option=orjson.OPT_INDENT_2))
     
     print(f"✅ Template text extracted and saved to {OUTPUT_TEMPLATE_FILE}")
 
@@ -1,9 +1,10 @@
 import os
-import json
+import orjson
 import csv
 import re
 import time
 import multiprocessing
+import numpy as np
 from collections import defaultdict
 from difflib import SequenceMatcher
 from concurrent.futures import ProcessPoolExecutor
@@ -13,14 +14,37 @@ MATCHES_REPORT_FILE = "matches_report.csv"
 SUMMARY_REPORT_FILE = "summary_report.csv"
 TEXT_SIMILARITY_THRESHOLD = 0.75
 BATCH_SIZE = 1  # Adjust batch size as needed
+IMAGE_HASH_MAX_DISTANCE = 4  # Hashes differing in at most this many bits count as the same image
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")  # Split after sentence-ending punctuation
 
 def load_processed_files():
     """Load extracted text and image hashes from JSON files, ignoring `template_text.json`."""
     data = {}
-    for file in os.listdir(PROCESSED_DIRECTORY):
-        if file.endswith(".json") and file != "template_text.json":  # Ignore template_text.json
-            with open(os.path.join(PROCESSED_DIRECTORY, file), "r", encoding="utf-8") as f:
-                data[file] = json.load(f)
+    with os.scandir(PROCESSED_DIRECTORY) as entries:
+        json_paths = {entry.name: entry.path for entry in entries if entry.is_file() and entry.name.endswith(".json")}
+
+    for file, path in json_paths.items():
+        if file != "template_text.json":  # Ignore template_text.json
+            with open(path, "rb") as f:
+                document = orjson.loads(f.read())
+
+            # Firm info and other extraction fields are never compared, so they are not kept
+            data[file] = {key: document[key] for key in ("text_by_page", "images") if key in document}
+
+            # Hex perceptual hashes and page numbers become parallel arrays per document for vectorized matching
+            images = data[file].get("images")
+            if images:
+                hex_hashes = images["hash"]
+                images["hash"] = np.fromiter((int(h, 16) for h in hex_hashes), dtype=np.uint64, count=len(hex_hashes))
+                images["page"] = np.asarray(images["page"], dtype=np.int32)
+
+            # Pages are cleaned and split into sentences once per document instead of once per pair;
+            # JSON page keys become ints here so page-range checks need no conversion
+            text_by_page = data[file].get("text_by_page")
+            if text_by_page is not None:
+                text_by_page = data[file]["text_by_page"] = {int(page): text for page, text in text_by_page.items()}
+                data[file]["max_page"] = max(text_by_page, default=0)
+                data[file]["sentences"] = split_sentences(text_by_page, data[file]["max_page"])
     return data
 
 def get_processed_rows_count():
@@ -33,80 +57,79 @@ def get_processed_rows_count():
 
 def clean_text(text):
     """Normalize text by removing extra spaces, special characters, and case differences."""
-    text = text.lower()
-    text = re.sub(r'\s+', ' ', text)  # Remove excessive whitespace
-    text = text.replace('\u00a0', ' ')  # Replace non-breaking spaces
-    return text.strip()
-
-def text_similarity(text1, text2):
-    """Compute similarity ratio between two texts."""
-    return SequenceMatcher(None, text1, text2).ratio()
+    return " ".join(text.lower().split())  # Trim and collapse whitespace (non-breaking spaces included)
+
+def is_text_match(text1, matcher2):
+    """Check whether text1 reaches the similarity threshold against the text indexed as seq2 of a SequenceMatcher."""
+    matcher2.set_seq1(text1)  # Reuses the seq2 index instead of rebuilding it per comparison
+    # real_quick_ratio (lengths only) and quick_ratio (character counts) are upper bounds on ratio,
+    # so most unrelated sentences are rejected before the full diff runs
+    if matcher2.real_quick_ratio() < TEXT_SIMILARITY_THRESHOLD:
+        return False
+    if matcher2.quick_ratio() < TEXT_SIMILARITY_THRESHOLD:
+        return False
+    return matcher2.ratio() >= TEXT_SIMILARITY_THRESHOLD
+
+def split_sentences(text_by_page, max_page):
+    """Split each page between page 9 and the last 11 pages into cleaned sentences longer than 50 characters."""
+    sentences = []
+    for page, text in text_by_page.items():
+        if page < 9 or page > max_page - 11:  # Ignore before page 9 and last 11 pages
+            continue
+        sentences.append((page, [s.strip() for s in SENTENCE_SPLIT_RE.split(clean_text(text)) if len(s) > 50]))
+    return sentences
 
-def extract_matching_sentences(text_by_page1, text_by_page2):
+def extract_matching_sentences(sentences1, sentences2):
     """Find and return matching sentences along with their actual page locations."""
     matches = []
-    max_page1 = max(map(int, text_by_page1.keys()))  # Get the highest page number
-    for page1, text1 in text_by_page1.items():
-        if int(page1) < 9 or int(page1) > max_page1 - 11:  # Ignore before page 9 and last 11 pages
-            continue
-        sentences1 = [(page1, s.strip()) for s in re.split(r'(?<=[.!?])\s+', clean_text(text1)) if len(s) > 50]
-        max_page2 = max(map(int, text_by_page2.keys()))  # Get the highest page number
-        for page2, text2 in text_by_page2.items():
-            if int(page2) < 9 or int(page2) > max_page2 - 11:  # Ignore before page 9 and last 11 pages
-                continue
-            sentences2 = [(page2, s.strip()) for s in re.split(r'(?<=[.!?])\s+', clean_text(text2)) if len(s) > 50]
-
-            for (p1, sent1) in sentences1:
-                for (p2, sent2) in sentences2:
-                    similarity = text_similarity(sent1, sent2)
-                    if similarity >= TEXT_SIMILARITY_THRESHOLD:
-                        matches.append((p1, p2, sent1[:200] + "..."))  # Truncate long text
+    # Index each sentence of the second document once for the whole pair
+    matchers2 = [(page2, [SequenceMatcher(None, "", sent2) for sent2 in sents2]) for page2, sents2 in sentences2]
+    for page1, sents1 in sentences1:
+        for page2, page_matchers2 in matchers2:
+            for sent1 in sents1:
+                for matcher2 in page_matchers2:
+                    if is_text_match(sent1, matcher2):
+                        matches.append((page1, page2, sent1[:200] + "..."))  # Truncate long text
     return matches
 
-def compare_images(image1, image2):
-    p1, hash1, file1, pos1 = image1  # Extract values from tuple
-    p2, hash2, file2, pos2 = image2  # Extract values from tuple
-
-    print(f"🔍 Checking Image Hash: {hash1} vs {hash2}")  # Debug
-
-    if hash1 == hash2:  # Only compare the hash
-        print(f"✅ [MATCH] Image Match on Page {p1} ↔ Page {p2}")
-        return (p1, p2, pos1, pos2)  # Return page numbers + positions
-    return None  # No match
-
 def process_image_comparison(images1, images2, max_page1, max_page2):
     """Compare images but ignore pages before 9 and last 11 pages."""
     process_id = os.getpid()  # Get process ID
-    print(f"⚡ [Process {process_id}] Started image comparison ({len(images1)} vs {len(images2)} images)...")
+    print(f"⚡ [Process {process_id}] Started image comparison ({len(images1['hash'])} vs {len(images2['hash'])} images)...")
 
     start_time = time.time()
     matches = []
 
-    for img1 in images1:
-        page1 = img1["page"]
-        if page1 < 9 or page1 > max_page1 - 11:
-            continue
-
-        for img2 in images2:
-            page2 = img2["page"]
-            if page2 < 9 or page2 > max_page2 - 11:
-                continue
+    # Only images between page 9 and the last 11 pages take part
+    pages1, pages2 = images1["page"], images2["page"]
+    keep1 = np.flatnonzero((pages1 >= 9) & (pages1 <= max_page1 - 11))
+    keep2 = np.flatnonzero((pages2 >= 9) & (pages2 <= max_page2 - 11))
 
-            print(f"🔍 Comparing {img1['image_file']} (Page {page1}) ↔ {img2['image_file']} (Page {page2})")
-            result = compare_images((page1, img1["hash"], img1["image_file"], img1["position"]),
-                                    (page2, img2["hash"], img2["image_file"], img2["position"]))
-            if result:
-                print(f"✅ Match found: Page {result[0]} ↔ Page {result[1]}")
-                matches.append(result)
+    # Hamming distance of every kept hash pair at once (XOR, then count the differing bits), so
+    # near-duplicates match too; nonzero() yields the pairs in the same order as nested loops
+    distances = np.bitwise_count(images1["hash"][keep1][:, None] ^ images2["hash"][keep2][None, :])
+    for i, j in zip(*np.nonzero(distances <= IMAGE_HASH_MAX_DISTANCE)):
+        idx1, idx2 = keep1[i], keep2[j]
+        result = (int(pages1[idx1]), int(pages2[idx2]), images1["position"][idx1], images2["position"][idx2])
+        print(f"✅ Match found: Page {result[0]} ↔ Page {result[1]}")
+        matches.append(result)
 
     elapsed_time = time.time() - start_time
     print(f"✅ [Process {process_id}] Completed in {elapsed_time:.2f} seconds. {len(matches)} matches found.")
     return matches
 
+# Image arrays of every document, shared with each worker process once via the pool initializer
+worker_images = {}
+
+def init_worker(images_by_file):
+    """Store every document's image arrays in the worker so tasks only carry file names."""
+    global worker_images
+    worker_images = images_by_file
+
 def run_image_comparison_task(args):
     """Helper function to unpack arguments for process_image_comparison."""
-    file1, file2, images1, images2, max_page1, max_page2 = args
-    results = process_image_comparison(images1, images2, max_page1, max_page2)
+    file1, file2, max_page1, max_page2 = args
+    results = process_image_comparison(worker_images[file1], worker_images[file2], max_page1, max_page2)
     return [(file1, file2, *match) for match in results]  # Add filenames to results
 
 def compare_documents_in_batches(data):
@@ -124,101 +147,111 @@ def compare_documents_in_batches(data):
     current_batch = 1
     num_cpus = max(1, os.cpu_count() - 1)
 
-    # Divide work into batches
-    for i in range(batch_start, len(files), BATCH_SIZE):
-        batch_files = files[i:i+BATCH_SIZE]
-        print(f"Processing batch {current_batch} (Files {i+1} to {i+len(batch_files)})")
-
-        image_comparison_tasks = []
-        for file1 in batch_files:
-            if "text_by_page" not in data[file1]:
-                print(f"❌ ERROR: Missing 'text_by_page' in {file1}.")
-                continue
-
-            text_by_page1 = data[file1]["text_by_page"]
-            images1 = data[file1].get("images", [])
-            max_page1 = max(map(int, text_by_page1.keys())) if text_by_page1 else 0
-
-            for file2 in files:
-                if file1 == file2:
-                    continue  # Skip self-comparison
-
-                # To avoid duplicate comparisons, sort and check if pair has already been processed
-                file_pair = tuple(sorted([file1, file2]))
-                if file_pair in processed_pairs:
-                    continue  # Skip if this pair has already been processed
-                processed_pairs.add(file_pair)  # Mark this pair as processed
-
-                if "text_by_page" not in data[file2]:
-                    print(f"❌ ERROR: Missing 'text_by_page' in {file2}.")
+    # The report is rewritten from the header once per run; each batch then only appends its own rows
+    if batch_start < len(files):
+        start_matches_csv()
+
+    # One pool for the whole run; each worker receives the image arrays once instead of with every task
+    images_by_file = {file: doc["images"] for file, doc in data.items() if len(doc.get("images", {}).get("hash", ())) > 0}
+    with ProcessPoolExecutor(max_workers=num_cpus, initializer=init_worker, initargs=(images_by_file,)) as executor:
+        # Divide work into batches
+        for i in range(batch_start, len(files), BATCH_SIZE):
+            batch_files = files[i:i+BATCH_SIZE]
+            batch_match_start = len(matches)
+            print(f"Processing batch {current_batch} (Files {i+1} to {i+len(batch_files)})")
+
+            image_comparison_tasks = []
+            for file1 in batch_files:
+                if "text_by_page" not in data[file1]:
+                    print(f"❌ ERROR: Missing 'text_by_page' in {file1}.")
                     continue
 
-                text_by_page2 = data[file2]["text_by_page"]
-                images2 = data[file2].get("images", [])
-                max_page2 = max(map(int, text_by_page2.keys())) if text_by_page2 else 0
+                sentences1 = data[file1]["sentences"]
+                images1 = data[file1].get("images", {})
+                has_images1 = len(images1.get("hash", ())) > 0
+                max_page1 = data[file1]["max_page"]
+
+                for file2 in files:
+                    if file1 == file2:
+                        continue  # Skip self-comparison
+
+                    # To avoid duplicate comparisons, sort and check if pair has already been processed
+                    file_pair = tuple(sorted([file1, file2]))
+                    if file_pair in processed_pairs:
+                        continue  # Skip if this pair has already been processed
+                    processed_pairs.add(file_pair)  # Mark this pair as processed
+
+                    if "text_by_page" not in data[file2]:
+                        print(f"❌ ERROR: Missing 'text_by_page' in {file2}.")
+                        continue
 
-                matching_sentences = extract_matching_sentences(text_by_page1, text_by_page2)
+                    images2 = data[file2].get("images", {})
+                    has_images = has_images1 and len(images2.get("hash", ())) > 0
+                    max_page2 = data[file2]["max_page"]
 
-                if images1 and images2:
-                    image_comparison_tasks.append((file1, file2, images1, images2, max_page1, max_page2))
+                    matching_sentences = extract_matching_sentences(sentences1, data[file2]["sentences"])
 
-                if matching_sentences:
-                    summary_data[file1]["text_match"] = True
-                    summary_data[file2]["text_match"] = True
+                    if has_images:
+                        image_comparison_tasks.append((file1, file2, max_page1, max_page2))
 
-                if images1 and images2:
-                    summary_data[file1]["image_match"] = True
-                    summary_data[file2]["image_match"] = True
+                    if matching_sentences:
+                        summary_data[file1]["text_match"] = True
+                        summary_data[file2]["text_match"] = True
 
-                if matching_sentences:
-                    summary_data[file1]["matches"].append(file2)
-                    summary_data[file2]["matches"].append(file1)
-                    for p1, p2, txt in matching_sentences:
-                        matches.append([file1, file2, "Text Match", f"Page {p1}", f"Page {p2}", txt, ""])
+                    if has_images:
+                        summary_data[file1]["image_match"] = True
+                        summary_data[file2]["image_match"] = True
 
-        # Execute image comparison for the batch
-        if image_comparison_tasks:
-            with ProcessPoolExecutor(max_workers=num_cpus) as executor:
+                    if matching_sentences:
+                        summary_data[file1]["matches"].append(file2)
+                        summary_data[file2]["matches"].append(file1)
+                        for p1, p2, txt in matching_sentences:
+                            matches.append([file1, file2, "Text Match", f"Page {p1}", f"Page {p2}", txt, ""])
+
+            # Execute image comparison for the batch
+            if image_comparison_tasks:
                 results = list(executor.map(run_image_comparison_task, image_comparison_tasks))
 
-            for result_set in results:
-                for file1, file2, p1, p2, pos1, pos2 in result_set:
-                    matches.append([file1, file2, "Image Match", f"Page {p1}", f"Page {p2}", pos1, pos2])
+                for result_set in results:
+                    for file1, file2, p1, p2, pos1, pos2 in result_set:
+                        matches.append([file1, file2, "Image Match", f"Page {p1}", f"Page {p2}", pos1, pos2])
 
-        # Save progress after processing each batch
-        save_matches_to_csv(matches)  # Save matches to CSV after processing the batch
-        save_summary_to_csv(summary_data)
+            # Save progress after processing each batch
+            save_matches_to_csv(matches[batch_match_start:])  # Append this batch's matches to the CSV
+            save_summary_to_csv(summary_data)
 
-        print(f"✅ Batch {current_batch} complete. {len(matches)} total matches so far.")
-        current_batch += 1
+            print(f"✅ Batch {current_batch} complete. {len(matches)} total matches so far.")
+            current_batch += 1
 
     return matches, summary_data
 
     
-def save_matches_to_csv(matches):
-    """Save detailed matches to a CSV file with properly structured columns."""
+def format_match_row(match):
+    """Reorder a match into the matches report's column layout."""
+    file1, file2, match_type, file1_page, file2_page = match[:5]
+
+    if match_type == "Text Match":
+        matched_text = match[5]  # Store matched text
+        file1_position = ""
+        file2_position = ""
+    elif match_type == "Image Match":
+        file1_position = match[5]
+        file2_position = match[6]
+        matched_text = ""
+
+    return [match_type, file1, file2, file1_page, file2_page, file1_position, file2_position, matched_text]
+
+def start_matches_csv():
+    """Create the matches report CSV with just its header row."""
     with open(MATCHES_REPORT_FILE, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow(["Match Type", "File1", "File2", "File1 Page", "File2 Page", "File1 Position", "File2 Position", "Matched Text"])
 
-        for match in matches:
-            match_type = match[2]  # Ensure Match Type is correctly assigned
-            file1 = match[0]
-            file2 = match[1]
-            file1_page = match[3]
-            file2_page = match[4]
-
-            if match_type == "Text Match":
-                matched_text = match[5]  # Store matched text
-                file1_position = ""
-                file2_position = ""
-            elif match_type == "Image Match":
-                file1_position = match[5]
-                file2_position = match[6]
-                matched_text = ""
-
-            # Write in proper order
-            writer.writerow([match_type, file1, file2, file1_page, file2_page, file1_position, file2_position, matched_text])
+def save_matches_to_csv(matches):
+    """Append a batch of detailed matches to the CSV file with properly structured columns."""
+    with open(MATCHES_REPORT_FILE, "a", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        writer.writerows(map(format_match_row, matches))  # One call for all rows through a 1 MiB buffer
     
     print(f"✅ Match results saved to {MATCHES_REPORT_FILE}")
 